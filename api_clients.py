@@ -5,6 +5,7 @@ import dashscope
 from abc import ABC, abstractmethod
 import time
 from exception_handler import retry_with_exponential_backoff
+from profiler import profiled, span
 
 class BaseAPIClient(ABC):
     """API客户端的抽象基类"""
@@ -28,6 +29,7 @@ class DeepSeekClient(BaseAPIClient):
         )
 
     @retry_with_exponential_backoff(max_retries=3)
+    @profiled("DeepSeekClient.generate_stream")
     def generate_stream(self, messages, temperature, top_p, max_tokens, callback):
         try:
             stream = self.client.chat.completions.create(
@@ -40,9 +42,15 @@ class DeepSeekClient(BaseAPIClient):
             )
             
             full_response = ""
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
+            # 手动驱动迭代器，使区间覆盖SDK读取与解析每个块（含网络等待）
+            chunks = iter(stream)
+            while True:
+                with span("DeepSeekClient.next_chunk"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                content = chunk.choices[0].delta.content
+                if content is not None:
                     full_response += content
                     callback(content)
             return full_response
@@ -57,6 +65,7 @@ class QwenClient(BaseAPIClient):
         dashscope.api_key = self.api_key
 
     @retry_with_exponential_backoff(max_retries=3)
+    @profiled("QwenClient.generate_stream")
     def generate_stream(self, messages, temperature, top_p, max_tokens, callback):
         # Dashscope的temperature范围是(0, 2)，需要转换
         temp_for_qwen = max(0.01, min(temperature * 2, 1.99))
@@ -77,7 +86,13 @@ class QwenClient(BaseAPIClient):
             # 跟踪上一次接收到的内容
             last_content = ""
             
-            for chunk in response:
+            # 手动驱动迭代器，使区间覆盖SDK读取与解析每个块（含网络等待）
+            chunks = iter(response)
+            while True:
+                with span("QwenClient.next_chunk"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
                 if chunk.status_code == 200:
                     if 'content' in chunk.output.choices[0]['message']:
                         current_content = chunk.output.choices[0]['message']['content']
@@ -0,0 +1,90 @@
+#conversation_history.py
+import sys
+import json
+import zlib
+import threading
+
+class Message:
+    """紧凑的消息记录，role 与 model 字符串经过驻留以共享内存"""
+    __slots__ = ("role", "content", "model")
+
+    def __init__(self, role, content, model=""):
+        self.role = sys.intern(role)
+        self.content = content
+        self.model = sys.intern(model)
+
+    def to_api(self):
+        """转换为SDK所需的消息字典"""
+        return {"role": self.role, "content": self.content}
+
+class _Node:
+    """持久化链表节点，新消息只引用旧节点，实现结构共享"""
+    __slots__ = ("message", "parent", "length")
+
+    def __init__(self, message, parent):
+        self.message = message
+        self.parent = parent
+        self.length = parent.length + 1 if parent is not None else 1
+
+class HistorySnapshot:
+    """对话历史的不可变快照，创建开销为 O(1)"""
+    __slots__ = ("_tail",)
+
+    def __init__(self, tail):
+        self._tail = tail
+
+    def __len__(self):
+        return self._tail.length if self._tail is not None else 0
+
+    def __iter__(self):
+        messages = []
+        node = self._tail
+        while node is not None:
+            messages.append(node.message)
+            node = node.parent
+        return reversed(messages)
+
+    def to_api_messages(self):
+        """在发送请求时才转换为SDK消息字典列表"""
+        return [message.to_api() for message in self]
+
+class ChatHistory:
+    """单个对话的历史记录，支持 O(1) 追加与快照，以及非活动时压缩"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tail = None
+        self._compressed = None
+
+    def append(self, message):
+        """追加消息，返回其在对话中的序号"""
+        with self._lock:
+            self._decompress()
+            self._tail = _Node(message, self._tail)
+            return self._tail.length - 1
+
+    def snapshot(self):
+        """返回当前历史的不可变快照，后续追加不影响已取得的快照"""
+        with self._lock:
+            self._decompress()
+            return HistorySnapshot(self._tail)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def compress(self):
+        """将历史压缩为 zlib 数据块，下次访问时自动解压"""
+        with self._lock:
+            if self._tail is None:
+                return
+            records = [[m.role, m.content, m.model] for m in HistorySnapshot(self._tail)]
+            self._compressed = zlib.compress(json.dumps(records, ensure_ascii=False).encode("utf-8"))
+            self._tail = None
+
+    def _decompress(self):
+        """调用方需持有锁"""
+        if self._compressed is None:
+            return
+        records = json.loads(zlib.decompress(self._compressed).decode("utf-8"))
+        self._compressed = None
+        for role, content, model in records:
+            self._tail = _Node(Message(role, content, model), self._tail)
@@ -1,5 +1,7 @@
 import tkinter as tk
 from tkinter import scrolledtext
+from profiler import profiled
+from markdown_stream import StreamingMarkdownFormatter
 
 class GUIUtils:
     """GUI实用工具类"""
@@ -14,6 +16,7 @@ class GUIUtils:
         return text_widget
     
     @staticmethod
+    @profiled("GUIUtils.display_message")
     def display_message(text_widget, role, text, model_name="", tags_config=None):
         """在文本框中显示消息"""
         if tags_config is None:
@@ -37,7 +40,13 @@ class GUIUtils:
         elif role == "assistant":
             header = f"{model_name}:\n" if model_name else "Assistant:\n"
             text_widget.insert(tk.END, header, "assistant")
-            text_widget.insert(tk.END, f"{text}\n\n")
+            if text:
+                # 首次使用时为控件配置Markdown标签，之后只创建轻量的解析状态
+                formatter = StreamingMarkdownFormatter(text_widget)
+                formatter.feed(f"{text}\n\n")
+                formatter.finish()
+            else:
+                text_widget.insert(tk.END, "\n\n")
         elif role == "system":
             text_widget.insert(tk.END, f"System: {text}\n\n", "system")
             
@@ -45,11 +54,15 @@ class GUIUtils:
         text_widget.yview(tk.END)
     
     @staticmethod
-    def display_streaming_chunk(text_widget, chunk, model_name=""):
+    @profiled("GUIUtils.display_streaming_chunk")
+    def display_streaming_chunk(text_widget, chunk, model_name="", formatter=None):
         """显示流式响应的单个块 - 修复顺序问题"""
         text_widget.config(state='normal')
         
-        # 直接插入到文本末尾
-        text_widget.insert(tk.END, chunk)
+        # 直接插入到文本末尾，有格式化器时增量应用Markdown标签
+        if formatter is not None:
+            formatter.feed(chunk)
+        else:
+            text_widget.insert(tk.END, chunk)
         text_widget.config(state='disabled')
         text_widget.yview(tk.END)
\ No newline at end of file
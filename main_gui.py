@@ -4,11 +4,16 @@ from tkinter import ttk, messagebox
 import threading
 import queue
 import os
+import signal
 from dotenv import load_dotenv
 from api_clients import DeepSeekClient, QwenClient
 from input_processor import InputProcessor
 from gui_utils import GUIUtils
+from markdown_stream import StreamingMarkdownFormatter
 from exception_handler import StructuredOutputHandler
+from search_index import ConversationSearchIndex
+from conversation_history import ChatHistory, Message
+from profiler import profiler, profiled, span
 
 class LLMChatGUI:
     def __init__(self, master):
@@ -25,10 +30,20 @@ class LLMChatGUI:
         self.input_processor = InputProcessor()
 
         # --- 状态管理 ---
-        self.conversations = {}
+        self.conversations = {}  # {chat_id: ChatHistory}
+        # 切换对话时是否压缩非活动对话的历史
+        self.compress_inactive_chats = os.getenv("LLM_CHAT_COMPRESS_INACTIVE", "") == "1"
+        self.inflight_chats = {}  # 有请求进行中的对话: {chat_id: 请求数}
         self.current_chat_id = None
+        self.next_chat_number = 1  # 单调递增，删除对话后编号不会被复用
         self.response_queue = queue.Queue()
         self.active_streams = {}  # 跟踪活动流: {model_name: stream_thread}
+        self.search_index = ConversationSearchIndex()
+        self.search_results = []
+        self._search_after_id = None
+
+        # --- 菜单栏 ---
+        self._create_menu()
 
         # --- 创建主框架 ---
         main_frame = ttk.Frame(master, padding="10")
@@ -57,7 +72,39 @@ class LLMChatGUI:
         self.master.after(100, self._check_queue)
         self.master.protocol("WM_DELETE_WINDOW", self._on_close)
 
+        # 性能分析: 环境变量启动时开启，SIGUSR1 可在运行中切换
+        if os.getenv("LLM_CHAT_PROFILE", "") == "1":
+            self._set_profiling(True)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.master.after(0, self._toggle_profiling))
+
+    def _create_menu(self):
+        menubar = tk.Menu(self.master)
+        debug_menu = tk.Menu(menubar, tearoff=0)
+        self.profiling_var = tk.BooleanVar(value=False)
+        debug_menu.add_checkbutton(
+            label="Profiling (cProfile + tracemalloc)",
+            variable=self.profiling_var,
+            command=lambda: self._set_profiling(self.profiling_var.get())
+        )
+        menubar.add_cascade(label="Debug", menu=debug_menu)
+        self.master.config(menu=menubar)
+
     def _create_left_pane(self, parent):
+        # 全文搜索
+        search_frame = ttk.LabelFrame(parent, text="Search", padding="10")
+        search_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(fill=tk.X)
+        search_entry.bind("<KeyRelease>", self._on_search_changed)
+        search_entry.bind("<Return>", lambda event: self._run_search())
+
+        self.search_listbox = tk.Listbox(search_frame, height=6, exportselection=False)
+        self.search_listbox.pack(fill=tk.X, pady=(5, 0))
+        self.search_listbox.bind("<<ListboxSelect>>", self._on_search_select)
+
         # 对话管理
         chat_list_frame = ttk.LabelFrame(parent, text="Conversations", padding="10")
         chat_list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -147,6 +194,18 @@ class LLMChatGUI:
         self.qwen_display.tag_config("assistant", foreground="purple")  # 使用不同颜色区分
         self.qwen_display.tag_config("system", foreground="red", font=("Helvetica", 10, "italic"))
         
+        for display in (self.deepseek_display, self.qwen_display):
+            display.tag_config("search_hit", background="yellow")
+            StreamingMarkdownFormatter.configure_tags(display)
+            # 后创建的标签优先级更高，提升高亮以免被代码块背景遮住
+            display.tag_raise("search_hit")
+        
+        # 流式回复的增量Markdown格式化器
+        self.markdown_formatters = {
+            "DeepSeek": StreamingMarkdownFormatter(self.deepseek_display),
+            "Qwen": StreamingMarkdownFormatter(self.qwen_display)
+        }
+        
         # 初始隐藏Qwen面板
         self.paned_window.forget(1)  # 隐藏右侧面板
         
@@ -232,13 +291,15 @@ class LLMChatGUI:
             GUIUtils.display_streaming_chunk(
                 self.deepseek_display, 
                 chunk, 
-                model_name
+                model_name,
+                self.markdown_formatters[model_name]
             )
         elif model_name == "Qwen":
             GUIUtils.display_streaming_chunk(
                 self.qwen_display, 
                 chunk, 
-                model_name
+                model_name,
+                self.markdown_formatters[model_name]
             )
 
     def _send_message(self):
@@ -249,7 +310,8 @@ class LLMChatGUI:
             return
 
         # 输入预处理
-        processed_input = self.input_processor.process(user_input)
+        with span("InputProcessor.process"):
+            processed_input = self.input_processor.process(user_input)
         if processed_input != user_input:
             self._display_message("system", "输入已进行安全处理")
 
@@ -263,23 +325,28 @@ class LLMChatGUI:
             messagebox.showerror("Error", "请至少选择一个模型。")
             return
 
-        self._display_message("user", processed_input)
-        self.conversations[self.current_chat_id].append({"role": "user", "content": processed_input})
+        message_index = self._append_message(self.current_chat_id, Message("user", processed_input))
+        self._display_history_message(message_index, "user", processed_input)
+        self._refresh_search()
         self.input_text.delete("1.0", tk.END)
 
         # 禁用输入和按钮
         self.send_button.config(state='disabled')
         self.input_text.config(state='disabled')
 
+        # 不可变快照在Tk线程中获取 (O(1))，所有模型线程共享，无需逐个复制
+        chat_id = self.current_chat_id
+        history = self.conversations[chat_id].snapshot()
+        self.inflight_chats[chat_id] = self.inflight_chats.get(chat_id, 0) + 1
+
         # 在新线程中调用API
         threading.Thread(
             target=self._get_responses_thread, 
-            args=(selected_models, processed_input), 
+            args=(selected_models, chat_id, history), 
             daemon=True
         ).start()
 
-    def _get_responses_thread(self, models, user_input):
-        history = self.conversations[self.current_chat_id]
+    def _get_responses_thread(self, models, chat_id, history):
         params = {
             "temperature": self.temp_var.get(),
             "top_p": self.top_p_var.get(),
@@ -294,7 +361,7 @@ class LLMChatGUI:
             # 为每个模型创建线程
             thread = threading.Thread(
                 target=self._call_api_stream, 
-                args=(model, history.copy(), params),
+                args=(model, chat_id, history, params),
                 daemon=True
             )
             threads.append(thread)
@@ -306,9 +373,9 @@ class LLMChatGUI:
             thread.join()
         
         # 所有响应接收完毕，恢复输入
-        self.response_queue.put(("DONE", None))
+        self.response_queue.put(("DONE", chat_id))
 
-    def _call_api_stream(self, model_name, history, params):
+    def _call_api_stream(self, model_name, chat_id, history, params):
         """调用API流式接口并处理响应"""
         # 在流式输出开始前添加助手消息占位符
         self.response_queue.put(("assistant_start", model_name))
@@ -336,25 +403,22 @@ class LLMChatGUI:
             def callback(chunk):
                 nonlocal full_response
                 # 处理结构化输出错误
-                processed_chunk = StructuredOutputHandler.handle_api_output(chunk)
+                with span("StructuredOutputHandler.handle_api_output"):
+                    processed_chunk = StructuredOutputHandler.handle_api_output(chunk)
                 full_response += processed_chunk
                 # 直接发送chunk内容
                 self.response_queue.put(("chunk", (model_name, processed_chunk)))
 
             # 调用流式生成方法
             client.generate_stream(
-                messages=history,
+                messages=history.to_api_messages(),
                 callback=callback,
                 **params
             )
             
-            # 将完整响应添加到对话历史
+            # 将完整响应交给Tk线程写入对话历史
             if not full_response.startswith("API错误"):
-                self.conversations[self.current_chat_id].append({
-                    "role": "assistant", 
-                    "content": full_response,
-                    "model": model_name
-                })
+                self.response_queue.put(("assistant_done", (chat_id, model_name, full_response)))
         except Exception as e:
             self.response_queue.put(("system", f"{model_name} 错误: {str(e)}"))
         finally:
@@ -367,34 +431,70 @@ class LLMChatGUI:
 
     def _check_queue(self):
         """从队列中获取响应并更新GUI"""
-        try:
-            while True:
-                item = self.response_queue.get_nowait()
-                if item[0] == "DONE":
-                    # 所有响应接收完毕，恢复输入
-                    self.send_button.config(state='normal')
-                    self.input_text.config(state='normal')
-                    self.input_text.focus_set()
-                elif item[0] == "system":
-                    self._display_message("system", item[1])
-                elif item[0] == "assistant_start":
-                    # 助手消息开始，添加标题
-                    model_name = item[1]
-                    self._display_message("assistant", "", model_name)  # 只显示标题
-                elif item[0] == "chunk":
-                    model_name, chunk = item[1]
-                    self._display_streaming_chunk(model_name, chunk)
-
-        except queue.Empty:
-            pass
+        with span("LLMChatGUI._check_queue"):
+            try:
+                while True:
+                    item = self.response_queue.get_nowait()
+                    if item[0] == "DONE":
+                        # 所有响应接收完毕，恢复输入
+                        self._finish_request(item[1])
+                        self.send_button.config(state='normal')
+                        self.input_text.config(state='normal')
+                        self.input_text.focus_set()
+                    elif item[0] == "system":
+                        self._display_message("system", item[1])
+                    elif item[0] == "assistant_start":
+                        # 助手消息开始，添加标题
+                        model_name = item[1]
+                        for display in self._message_displays("assistant", model_name):
+                            self._set_mark(display, f"stream_{model_name}", "end-1c")
+                        self._display_message("assistant", "", model_name)  # 只显示标题
+                        self.markdown_formatters[model_name].reset()
+                    elif item[0] == "assistant_done":
+                        # 在Tk线程写入历史与索引，与删除对话不存在竞争
+                        chat_id, model_name, content = item[1]
+                        if chat_id in self.conversations:
+                            message_index = self._append_message(chat_id, Message("assistant", content, model_name))
+                            self._mark_streamed_message(chat_id, message_index, model_name)
+                            self._refresh_search()
+                    elif item[0] == "chunk":
+                        model_name, chunk = item[1]
+                        self._display_streaming_chunk(model_name, chunk)
+
+            except queue.Empty:
+                pass
         
         self.master.after(50, self._check_queue)  # 更频繁地检查队列以获得流畅体验
 
     # --- 对话管理方法 ---
+    def _append_message(self, chat_id, message):
+        """追加消息到对话历史并更新搜索索引，返回消息序号"""
+        message_index = self.conversations[chat_id].append(message)
+        self.search_index.add_message(
+            chat_id,
+            message_index,
+            message.role,
+            message.content,
+            message.model
+        )
+        return message_index
+
+    def _finish_request(self, chat_id):
+        """请求结束后更新进行中的对话，已切换离开的对话此时再压缩"""
+        remaining = self.inflight_chats.get(chat_id, 0) - 1
+        if remaining > 0:
+            self.inflight_chats[chat_id] = remaining
+            return
+        self.inflight_chats.pop(chat_id, None)
+        if (self.compress_inactive_chats and chat_id != self.current_chat_id
+                and chat_id in self.conversations):
+            self.conversations[chat_id].compress()
+
     def _create_new_chat(self):
         """创建新的对话"""
-        chat_id = f"Chat {len(self.conversations) + 1}"
-        self.conversations[chat_id] = []  # 创建一个空的消息列表
+        chat_id = f"Chat {self.next_chat_number}"
+        self.next_chat_number += 1
+        self.conversations[chat_id] = ChatHistory()  # 创建一个空的对话历史
         self.chat_listbox.insert(tk.END, chat_id)
         self.chat_listbox.selection_clear(0, tk.END)
         self.chat_listbox.selection_set(tk.END)
@@ -413,6 +513,8 @@ class LLMChatGUI:
 
             if messagebox.askyesno("确认删除", f"确定要删除 '{chat_id}' 吗?"):
                 del self.conversations[chat_id]
+                self.search_index.remove_chat(chat_id)
+                self._refresh_search()
                 self.chat_listbox.delete(selected_index)
                 
                 # 自动选择一个新对话
@@ -438,8 +540,15 @@ class LLMChatGUI:
         except IndexError:
             pass  # 如果列表为空，会发生索引错误
 
+    @profiled("LLMChatGUI._load_chat_history")
     def _load_chat_history(self, chat_id):
         """加载指定对话的历史记录"""
+        previous_chat_id = self.current_chat_id
+        # 有请求进行中的对话暂不压缩，待请求结束后再压缩
+        if (self.compress_inactive_chats and previous_chat_id != chat_id
+                and previous_chat_id in self.conversations
+                and previous_chat_id not in self.inflight_chats):
+            self.conversations[previous_chat_id].compress()
         self.current_chat_id = chat_id
         
         # 清空两个显示区域
@@ -449,21 +558,19 @@ class LLMChatGUI:
         self.qwen_display.config(state='normal')
         self.qwen_display.delete("1.0", tk.END)
         
-        history = self.conversations.get(chat_id, [])
-        for message in history:
-            role = message["role"]
-            content = message["content"]
-            model_name = message.get("model", "")
-            
-            # 根据消息类型和模型显示到正确面板
-            if role == "user" or role == "system":
-                GUIUtils.display_message(self.deepseek_display, role, content, model_name)
-                GUIUtils.display_message(self.qwen_display, role, content, model_name)
-            elif role == "assistant":
-                if model_name == "DeepSeek":
-                    GUIUtils.display_message(self.deepseek_display, role, content, model_name)
-                elif model_name == "Qwen":
-                    GUIUtils.display_message(self.qwen_display, role, content, model_name)
+        # 已清空的文本中未完成行的位置失效，流式格式化器从新的末尾继续
+        for formatter in self.markdown_formatters.values():
+            formatter.reset()
+        
+        # 删除文本不会删除标记，需要显式清除旧对话的标记
+        for display in (self.deepseek_display, self.qwen_display):
+            for mark in display.mark_names():
+                if mark.startswith(("msg_", "stream_")):
+                    display.mark_unset(mark)
+        
+        history = self.conversations.get(chat_id, ())
+        for index, message in enumerate(history):
+            self._display_history_message(index, message.role, message.content, message.model)
         
         self.deepseek_display.config(state='disabled')
         self.deepseek_display.yview(tk.END)
@@ -476,8 +583,112 @@ class LLMChatGUI:
         self.input_text.config(state='normal')
         self.input_text.focus_set()
     
+    def _message_displays(self, role, model_name=""):
+        """返回消息应显示的面板"""
+        if role == "user" or role == "system":
+            return (self.deepseek_display, self.qwen_display)
+        if role == "assistant":
+            if model_name == "DeepSeek":
+                return (self.deepseek_display,)
+            if model_name == "Qwen":
+                return (self.qwen_display,)
+        return ()
+
+    def _set_mark(self, display, mark, index):
+        """设置左重力标记，之后在末尾插入的文本不会移动它"""
+        display.mark_set(mark, index)
+        display.mark_gravity(mark, tk.LEFT)
+
+    def _display_history_message(self, message_index, role, content, model_name=""):
+        """显示一条历史消息，并在其首尾设置标记供搜索结果跳转"""
+        for display in self._message_displays(role, model_name):
+            self._set_mark(display, f"msg_{message_index}", "end-1c")
+            GUIUtils.display_message(display, role, content, model_name)
+            self._set_mark(display, f"msg_{message_index}_end", "end-1c")
+
+    def _mark_streamed_message(self, chat_id, message_index, model_name):
+        """为已显示完毕的流式回复设置首尾标记"""
+        if chat_id != self.current_chat_id:
+            return
+        stream_mark = f"stream_{model_name}"
+        for display in self._message_displays("assistant", model_name):
+            # 流式输出期间重新加载过对话时标记已被清除，回复不在当前显示中
+            if stream_mark not in display.mark_names():
+                continue
+            self._set_mark(display, f"msg_{message_index}", stream_mark)
+            self._set_mark(display, f"msg_{message_index}_end", "end-1c")
+            display.mark_unset(stream_mark)
+
+    # --- 搜索方法 ---
+    def _on_search_changed(self, event):
+        """输入变化后延迟检索，避免每次按键都查询"""
+        if self._search_after_id is not None:
+            self.master.after_cancel(self._search_after_id)
+        self._search_after_id = self.master.after(150, self._run_search)
+
+    def _run_search(self):
+        """执行检索并刷新结果列表"""
+        self._search_after_id = None
+        with span("ConversationSearchIndex.search"):
+            self.search_results = self.search_index.search(self.search_var.get())
+        self.search_listbox.delete(0, tk.END)
+        for chat_id, _, role, model_name, preview in self.search_results:
+            speaker = model_name or role
+            self.search_listbox.insert(tk.END, f"[{chat_id}] {speaker}: {preview}")
+
+    def _refresh_search(self):
+        """索引变化后刷新已显示的搜索结果，避免保留失效的条目"""
+        if self.search_results or self.search_var.get().strip():
+            self._run_search()
+
+    def _on_search_select(self, event):
+        """跳转到选中的搜索结果"""
+        selection = self.search_listbox.curselection()
+        if not selection:
+            return
+        chat_id, message_index, role, model_name, _ = self.search_results[selection[0]]
+        if chat_id not in self.conversations:
+            return
+
+        # 仅在切换到其他对话时同步列表选中项并重新加载，避免打断当前流式输出
+        if chat_id != self.current_chat_id:
+            chat_ids = self.chat_listbox.get(0, tk.END)
+            chat_index = chat_ids.index(chat_id)
+            self.chat_listbox.selection_clear(0, tk.END)
+            self.chat_listbox.selection_set(chat_index)
+            self.chat_listbox.see(chat_index)
+            self._load_chat_history(chat_id)
+
+        for display in (self.deepseek_display, self.qwen_display):
+            display.tag_remove("search_hit", "1.0", tk.END)
+
+        start = f"msg_{message_index}"
+        end = f"msg_{message_index}_end"
+        for display in self._message_displays(role, model_name):
+            if start not in display.mark_names():
+                continue
+            display.tag_add("search_hit", start, end)
+            display.see(start)
+
+    # --- 性能分析方法 ---
+    def _set_profiling(self, enabled):
+        """开启或停止性能分析，停止时提示结果文件位置"""
+        self.profiling_var.set(enabled)
+        if enabled:
+            profiler.start()
+            return
+        paths = profiler.stop()
+        if paths:
+            messagebox.showinfo("Profiling", "分析结果已写入:\n" + "\n".join(paths))
+
+    def _toggle_profiling(self):
+        """切换性能分析状态"""
+        self._set_profiling(not profiler.enabled)
+
     def _on_close(self):
         """窗口关闭时的处理"""
+        if profiler.enabled:
+            profiler.stop()
         self.master.destroy()
 
 if __name__ == "__main__":
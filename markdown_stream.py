@@ -0,0 +1,113 @@
+#markdown_stream.py
+import re
+import tkinter as tk
+
+class StreamingMarkdownFormatter:
+    """
+    增量式 Markdown 格式化器
+    按块接收流式文本，跨块保存解析状态，只对新完成的行添加Tk标签，
+    每个块的开销与消息总长度无关
+    """
+    TAGS_CONFIG = {
+        "md_h1": {"font": ("Helvetica", 16, "bold")},
+        "md_h2": {"font": ("Helvetica", 14, "bold")},
+        "md_h3": {"font": ("Helvetica", 12, "bold")},
+        "md_bold": {"font": ("Helvetica", 10, "bold")},
+        "md_italic": {"font": ("Helvetica", 10, "italic")},
+        "md_inline_code": {"font": ("Courier", 10), "background": "#eeeeee", "foreground": "#c7254e"},
+        "md_code_block": {"font": ("Courier", 10), "background": "#f4f4f4"},
+        "md_code_fence": {"font": ("Courier", 10), "foreground": "gray"},
+    }
+    HEADING_PATTERN = re.compile(r"^(#{1,6})\s")
+    INLINE_PATTERNS = [
+        (re.compile(r"`[^`\n]+`"), "md_inline_code"),
+        (re.compile(r"\*\*[^*\n]+\*\*|__[^_\n]+__"), "md_bold"),
+        (re.compile(r"(?<![*\w])\*[^*\s][^*\n]*\*(?![*\w])"), "md_italic"),
+    ]
+
+    def __init__(self, text_widget):
+        self.text_widget = text_widget
+        # 控件尚未配置Markdown标签时才配置，避免重复的Tk调用
+        if not text_widget.tag_cget("md_code_block", "background"):
+            self.configure_tags(text_widget)
+        self.reset()
+
+    @classmethod
+    def configure_tags(cls, text_widget):
+        """为文本控件配置Markdown标签，构造格式化器时会按需自动调用"""
+        for tag, config in cls.TAGS_CONFIG.items():
+            text_widget.tag_configure(tag, **config)
+        # 行内代码优先于粗体/斜体显示
+        text_widget.tag_raise("md_inline_code")
+
+    def reset(self):
+        """开始新消息：丢弃未完成行并重置解析状态"""
+        self.in_code_block = False
+        # 未完成行的各段: [(插入起点, 文本), ...]
+        # 流式输出期间可能有其他文本插入到两段之间，因此按实际插入位置记录
+        self._pending = []
+
+    def feed(self, chunk):
+        """追加一个文本块并格式化其中新完成的行（调用方负责切换控件状态）"""
+        if not chunk:
+            return
+        insert_start = self.text_widget.index("end-1c")
+        self.text_widget.insert(tk.END, chunk)
+
+        offset = 0
+        lines = chunk.split("\n")
+        for part in lines[:-1]:
+            self._pending.append((f"{insert_start} + {offset} chars", part))
+            self._format_line(self._pending)
+            self._pending = []
+            offset += len(part) + 1
+
+        tail = lines[-1]
+        if tail:
+            segment = (f"{insert_start} + {offset} chars", tail)
+            self._pending.append(segment)
+            # 代码块内的未完成行即时着色
+            if self.in_code_block:
+                self._tag_range("md_code_block", [segment], 0, len(tail))
+
+    def finish(self):
+        """格式化剩余的未完成行"""
+        if self._pending:
+            self._format_line(self._pending)
+            self._pending = []
+
+    def _tag_range(self, tag, segments, start, end, remove=False):
+        """对行内 [start, end) 区间添加或移除标签，只作用于各段实际所在的位置"""
+        offset = 0
+        for segment_start, text in segments:
+            lo = max(start, offset)
+            hi = min(end, offset + len(text))
+            if lo < hi:
+                first = f"{segment_start} + {lo - offset} chars"
+                last = f"{segment_start} + {hi - offset} chars"
+                if remove:
+                    self.text_widget.tag_remove(tag, first, last)
+                else:
+                    self.text_widget.tag_add(tag, first, last)
+            offset += len(text)
+
+    def _format_line(self, segments):
+        """为一整行添加标签"""
+        line = "".join(text for _, text in segments)
+        length = len(line)
+
+        if line.lstrip().startswith("```"):
+            self._tag_range("md_code_block", segments, 0, length, remove=True)
+            self._tag_range("md_code_fence", segments, 0, length)
+            self.in_code_block = not self.in_code_block
+        elif self.in_code_block:
+            self._tag_range("md_code_block", segments, 0, length)
+        else:
+            heading = self.HEADING_PATTERN.match(line)
+            if heading:
+                level = min(len(heading.group(1)), 3)
+                self._tag_range(f"md_h{level}", segments, 0, length)
+            else:
+                for pattern, tag in self.INLINE_PATTERNS:
+                    for match in pattern.finditer(line):
+                        self._tag_range(tag, segments, match.start(), match.end())
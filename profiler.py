@@ -0,0 +1,126 @@
+#profiler.py
+import os
+import time
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import nullcontext
+from functools import wraps
+
+logger = logging.getLogger("Profiler")
+
+_NULL_SPAN = nullcontext()
+
+class _Span:
+    """记录一段代码耗时的上下文管理器"""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+class Profiler:
+    """运行时可开关的性能分析器：cProfile、tracemalloc 与命名耗时区间"""
+    def __init__(self, output_dir="profiles"):
+        self.output_dir = output_dir
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._owns_tracemalloc = False
+        self._span_stats = {}  # {name: [count, total, max]}
+
+    def start(self):
+        """开始分析（cProfile 作用于调用线程，通常为Tk主线程）"""
+        with self._lock:
+            if self.enabled:
+                return
+            self._span_stats = {}
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            self._owns_tracemalloc = not tracemalloc.is_tracing()
+            if self._owns_tracemalloc:
+                tracemalloc.start(25)
+            self.enabled = True
+        logger.info("性能分析已开启")
+
+    def stop(self):
+        """停止分析并写出带时间戳的结果文件，返回文件路径列表"""
+        with self._lock:
+            if not self.enabled:
+                return []
+            self.enabled = False
+            self._cprofile.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            span_stats = self._span_stats
+            cprofile, self._cprofile = self._cprofile, None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 精确到毫秒，避免同一秒内多次停止时覆盖文件
+        now = time.time()
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        base = os.path.join(self.output_dir, stamp)
+
+        profile_path = f"{base}_cprofile.prof"
+        cprofile.dump_stats(profile_path)
+
+        snapshot_path = f"{base}_tracemalloc.snapshot"
+        snapshot.dump(snapshot_path)
+        memory_path = f"{base}_tracemalloc.txt"
+        with open(memory_path, "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+
+        spans_path = f"{base}_spans.txt"
+        with open(spans_path, "w", encoding="utf-8") as f:
+            f.write(f"{'span':<40}{'count':>10}{'total_ms':>12}{'avg_ms':>10}{'max_ms':>10}\n")
+            ranked = sorted(span_stats.items(), key=lambda item: item[1][1], reverse=True)
+            for name, (count, total, longest) in ranked:
+                f.write(f"{name:<40}{count:>10}{total * 1000:>12.2f}"
+                        f"{total * 1000 / count:>10.3f}{longest * 1000:>10.3f}\n")
+
+        paths = [profile_path, snapshot_path, memory_path, spans_path]
+        logger.info(f"性能分析已停止，结果写入: {', '.join(paths)}")
+        return paths
+
+    def record_span(self, name, elapsed):
+        """累计命名区间的耗时"""
+        with self._lock:
+            stats = self._span_stats.get(name)
+            if stats is None:
+                self._span_stats[name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+profiler = Profiler(os.getenv("LLM_CHAT_PROFILE_DIR", "profiles"))
+
+def span(name):
+    """命名耗时区间；未开启分析时返回共享的空上下文，开销接近于零"""
+    if not profiler.enabled:
+        return _NULL_SPAN
+    return _Span(profiler, name)
+
+def profiled(name):
+    """为函数添加命名耗时区间的装饰器"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with _Span(profiler, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+#search_index.py
+import re
+import math
+import heapq
+import bisect
+import threading
+from collections import Counter
+from itertools import groupby, islice
+
+class ConversationSearchIndex:
+    """所有对话消息的增量倒排索引，支持排序的全文检索"""
+    # 中日韩文字按单字与双字切分，其他文字（含带重音的拉丁字母、西里尔字母等）按单词切分
+    WORD_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+|[^\W_\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+    CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+    PREVIEW_LENGTH = 60
+    MAX_CANDIDATES = 5000
+    MAX_PREFIX_TERMS = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}     # {term: {doc_id: 1 + log(tf)}}
+        self._docs = {}         # {doc_id: (chat_id, message_index, role, model, preview, terms)}
+        self._chat_docs = {}    # {chat_id: [doc_id, ...]}
+        self._terms = []        # 有序的索引词列表，用于前缀匹配
+        self._next_doc_id = 0
+
+    @classmethod
+    def tokenize(cls, text, query=False):
+        """
+        将文本切分为索引词
+        :param query: 为True时按查询切分，多字的中日韩文字只取双字，单字查询仍可命中单字索引
+        """
+        tokens = []
+        for run in cls.WORD_PATTERN.findall(text.lower()):
+            if cls.CJK_PATTERN.match(run):
+                if len(run) == 1 or not query:
+                    tokens.extend(run)
+                if len(run) > 1:
+                    tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            else:
+                tokens.append(run)
+        return tokens
+
+    def add_message(self, chat_id, message_index, role, content, model=""):
+        """索引一条新消息"""
+        term_counts = Counter(self.tokenize(content))
+        preview = " ".join(content.split())[:self.PREVIEW_LENGTH]
+
+        with self._lock:
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+            self._docs[doc_id] = (chat_id, message_index, role, model, preview, tuple(term_counts))
+            self._chat_docs.setdefault(chat_id, []).append(doc_id)
+            for term, tf in term_counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                postings[doc_id] = 1 + math.log(tf)
+        return doc_id
+
+    def remove_chat(self, chat_id):
+        """移除某个对话的全部消息"""
+        with self._lock:
+            for doc_id in self._chat_docs.pop(chat_id, []):
+                terms = self._docs.pop(doc_id)[5]
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        continue
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+                        del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def search(self, query, limit=50):
+        """
+        检索包含全部查询词的消息，按TF-IDF得分排序
+        查询末尾未输入完的非中日韩单词按前缀匹配，便于边输入边检索
+        :return: [(chat_id, message_index, role, model, preview), ...]
+        """
+        tokens = self.tokenize(query, query=True)
+        if not tokens:
+            return []
+        prefix = None
+        if query[-1:].isalnum() and not self.CJK_PATTERN.match(tokens[-1]):
+            prefix = tokens.pop()
+        terms = set(tokens)
+        terms.discard(prefix)
+
+        with self._lock:
+            # 每个查询词对应一组倒排表，文档命中组内任一表即视为匹配该词
+            groups = []
+            for term in terms:
+                term_postings = self._postings.get(term)
+                if not term_postings:
+                    return []
+                groups.append([term_postings])
+            if prefix is not None:
+                group = self._prefix_postings(prefix)
+                if not group:
+                    return []
+                groups.append(group)
+
+            # 从最小的组开始求交集，由新到旧遍历；
+            # 高频查询只对最新的 MAX_CANDIDATES 条匹配排序，保证延迟有界
+            groups.sort(key=lambda g: sum(len(p) for p in g))
+            first = groups[0]
+            exact = [g[0] for g in groups[1:] if len(g) == 1]
+            prefixed = [g for g in groups[1:] if len(g) > 1]
+            matches = (doc_id for doc_id in self._newest_first(first)
+                       if all(doc_id in p for p in exact)
+                       and all(any(doc_id in p for p in g) for g in prefixed))
+            candidates = list(islice(matches, self.MAX_CANDIDATES))
+            if not candidates:
+                return []
+
+            total_docs = len(self._docs)
+            weighted = [(g, math.log(1 + total_docs / sum(len(p) for p in g))) for g in groups]
+            if len(weighted) == 1 and len(weighted[0][0]) == 1:
+                (term_postings,), idf = weighted[0]
+                score = lambda doc_id: (term_postings[doc_id], doc_id)
+            else:
+                def score(doc_id):
+                    total = 0
+                    for g, idf in weighted:
+                        if len(g) == 1:
+                            total += g[0][doc_id] * idf
+                        else:
+                            total += max(p.get(doc_id, 0) for p in g) * idf
+                    return (total, doc_id)
+
+            # 同分时较新的消息靠前
+            top = heapq.nlargest(limit, candidates, key=score)
+            return [self._docs[doc_id][:5] for doc_id in top]
+
+    def _prefix_postings(self, prefix):
+        """返回以 prefix 开头的索引词的倒排表（最多 MAX_PREFIX_TERMS 个，调用方需持有锁）"""
+        start = bisect.bisect_left(self._terms, prefix)
+        group = []
+        for term in islice(self._terms, start, start + self.MAX_PREFIX_TERMS):
+            if not term.startswith(prefix):
+                break
+            group.append(self._postings[term])
+        return group
+
+    @staticmethod
+    def _newest_first(group):
+        """按文档从新到旧遍历一组倒排表的并集（倒排表按 doc_id 递增插入）"""
+        if len(group) == 1:
+            return reversed(group[0])
+        merged = heapq.merge(*(reversed(p) for p in group), reverse=True)
+        return (doc_id for doc_id, _ in groupby(merged))